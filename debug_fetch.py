@@ -1,18 +1,38 @@
-import requests
+import asyncio
+import httpx
 
-def test_url(url):
-    print(f"Testing {url}...")
+async def probe(client, url):
     try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.head(url, headers=headers)
-        print(f"Status: {response.status_code}")
-        print(f"Headers: {response.headers}")
-    except Exception as e:
-        print(f"Error: {e}")
+        response = await client.head(url)
+        return url, response.status_code, response.headers
+    except httpx.HTTPError as e:
+        return url, None, e
+
+async def test_urls(urls):
+    """
+    Probes all URLs concurrently over one connection pool and returns the
+    first URL (in the given priority order) that responds with 200.
+    """
+    async with httpx.AsyncClient(headers={'User-Agent': 'Mozilla/5.0'}, timeout=10) as client:
+        results = await asyncio.gather(*[probe(client, url) for url in urls])
+
+    for url, status, detail in results:
+        print(f"Testing {url}...")
+        if status is None:
+            print(f"Error: {detail}")
+        else:
+            print(f"Status: {status}")
+            print(f"Headers: {detail}")
+
+    return next((url for url, status, _ in results if status == 200), None)
 
 if __name__ == "__main__":
-    # Try P04637 (p53)
-    test_url("https://alphafold.ebi.ac.uk/files/AF-P04637-F1-model_v4.pdb")
-    test_url("https://alphafold.ebi.ac.uk/files/AF-P04637-F1-model_v3.pdb")
-    test_url("https://alphafold.ebi.ac.uk/files/AF-P04637-F1-model_v2.pdb")
-    test_url("https://alphafold.ebi.ac.uk/files/AF-P04637-F1-model_v1.pdb")
+    # Try P04637 (p53), newest version first
+    urls = [
+        "https://alphafold.ebi.ac.uk/files/AF-P04637-F1-model_v4.pdb",
+        "https://alphafold.ebi.ac.uk/files/AF-P04637-F1-model_v3.pdb",
+        "https://alphafold.ebi.ac.uk/files/AF-P04637-F1-model_v2.pdb",
+        "https://alphafold.ebi.ac.uk/files/AF-P04637-F1-model_v1.pdb",
+    ]
+    best = asyncio.run(test_urls(urls))
+    print(f"Highest available version: {best}")
@@ -1,18 +1,57 @@
 import os
 import argparse
+import asyncio
+import logging
+import threading
+import multiprocessing as mp
 import numpy as np
+from concurrent.futures import Future
 from Bio.PDB import PDBParser, PDBIO
 from src.analysis.region_finder import RegionFinder
 from src.llm.prompt_builder import PromptBuilder
 from src.llm.client import OpenAIClient, MockLLMClient, GeminiClient
 from src.llm.context_agent import ContextAgent
+from src.llm.cache import CachedLLMClient
+from src.llm.throttle import RateLimiter
 from src.geometry.refiner import GeometricRefiner
 from src.physics.minimizer import EnergyMinimizer
 from src.utils.data_fetcher import AlphaFoldFetcher
+from src.utils.sequence import residues_to_sequence
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Shared parser; QUIET avoids formatting BioPython's structure warnings (as in Evaluator)
+_PDB_PARSER = PDBParser(QUIET=True)
+
+# Debug trace of prompts, responses and applied constraints (pipeline_debug.log)
+debug_log = logging.getLogger("pipeline_debug")
+
+# Upper bound on in-flight LLM requests to stay within provider rate limits
+LLM_MAX_CONCURRENCY = 8
+
+# Combined multi-region prompts larger than this (approx. tokens) fall back to one request per region
+MULTI_PROMPT_TOKEN_BUDGET = 8000
+
+def run_in_background(fn, *args):
+    """
+    Runs fn(*args) in a daemon thread and returns a Future for its result.
+    Unlike a ThreadPoolExecutor worker, the thread is not joined at interpreter
+    exit, so returning early from the pipeline doesn't wait for an unused result.
+    """
+    future = Future()
+
+    def _run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_run, daemon=True).start()
+    return future
+
 def main():
     parser = argparse.ArgumentParser(description="LLM-Guided Protein Refinement")
     parser.add_argument("--uniprot", type=str, help="Uniprot ID to fetch (e.g., Q92947)")
@@ -25,22 +64,50 @@ def main():
     parser.add_argument("--context", type=str, help="Biological context for the protein")
     parser.add_argument("--auto_context", action="store_true", help="Automatically retrieve biological context using LLM")
     parser.add_argument("--focus_region", type=str, help="Specific region to refine (start-end, 1-based), overriding automatic detection")
+    parser.add_argument("--no_plddt_prompt", action="store_true", help="Omit pLDDT statistics from LLM prompts (with --focus_region, the confidence JSON is not loaded)")
+    parser.add_argument("--revalidate", action="store_true", help="Check cached AlphaFold files against the server (ETag) and re-download them if they changed")
+    parser.add_argument("--llm_rpm", type=int, help="Cap LLM requests per minute (default: no client-side cap)")
+    parser.add_argument("--eval_out", type=str, default="evaluation_results.txt", help="Path to write evaluation results")
+    parser.add_argument("--no_cache", action="store_true", help="Bypass the on-disk LLM response cache")
+    parser.add_argument("--workdir", type=str, default=".", help="Directory for intermediate files and the debug log")
     
     args = parser.parse_args()
 
+    os.makedirs(args.workdir, exist_ok=True)
+    # Open the debug log once and append to it for the rest of the run
+    log_handler = logging.FileHandler(os.path.join(args.workdir, "pipeline_debug.log"))
+    log_handler.setFormatter(logging.Formatter("%(message)s"))
+    debug_log.addHandler(log_handler)
+    debug_log.setLevel(logging.DEBUG)
+    debug_log.propagate = False
+
     # Initialize LLM Client early
     if args.provider == "mock":
         llm_client = MockLLMClient()
     elif args.provider == "openai":
-        llm_client = OpenAIClient(api_key=args.api_key)
+        llm_client = OpenAIClient(api_key=args.api_key, limiter=RateLimiter(rpm=args.llm_rpm, max_concurrency=LLM_MAX_CONCURRENCY))
     elif args.provider == "gemini":
-        llm_client = GeminiClient(api_key=args.api_key)
+        llm_client = GeminiClient(api_key=args.api_key, limiter=RateLimiter(rpm=args.llm_rpm, max_concurrency=LLM_MAX_CONCURRENCY))
+
+    if not args.no_cache:
+        llm_client = CachedLLMClient(llm_client)
+
+    # Start the auto-context lookup right away so its LLM round-trip overlaps
+    # with fetching, PDB parsing and region finding
+    context_future = None
+    if args.auto_context and not args.context:
+        if args.uniprot:
+            print("Auto-detecting biological context...")
+            context_agent = ContextAgent(llm_client)
+            context_future = run_in_background(context_agent.get_context, args.uniprot)
+        else:
+            print("Warning: --auto_context requires --uniprot ID. Skipping auto-context.")
 
     # 0. Fetch Data if Uniprot ID provided
     if args.uniprot:
         print(f"Fetching data for Uniprot ID: {args.uniprot}")
         fetcher = AlphaFoldFetcher()
-        pdb_path, json_path = fetcher.fetch(args.uniprot)
+        pdb_path, json_path = fetcher.fetch(args.uniprot, revalidate=args.revalidate)
     else:
         pdb_path = args.pdb
         json_path = args.json
@@ -49,29 +116,20 @@ def main():
         print("Error: Must provide either --uniprot or both --pdb and --json")
         return
 
-    # Determine Context
-    context = args.context
-    if args.auto_context and not context:
-        if args.uniprot:
-            print("Auto-detecting biological context...")
-            context_agent = ContextAgent(llm_client)
-            context = context_agent.get_context(args.uniprot)
-            with open("pipeline_debug.log", "a") as log:
-                log.write(f"--- AutoContext for {args.uniprot} ---\n")
-                log.write(f"Retrieved Context: {context}\n")
-        else:
-            print("Warning: --auto_context requires --uniprot ID. Skipping auto-context.")
-
     # 1. Identify Regions
     print(f"Identifying low-confidence regions in {pdb_path}...")
     finder = RegionFinder(plddt_threshold=70.0)
     
-    # Load scores
-    try:
-        plddt_scores = finder.load_confidence_json(json_path)
-    except Exception as e:
-        print(f"Error loading confidence JSON: {e}")
-        return
+    prompt_builder = PromptBuilder(include_plddt=not args.no_plddt_prompt)
+    
+    # Load scores (only needed to find regions or to describe them in the prompt)
+    plddt_scores = None
+    if not args.focus_region or prompt_builder.needs_plddt:
+        try:
+            plddt_scores = finder.load_confidence_json(json_path)
+        except Exception as e:
+            print(f"Error loading confidence JSON: {e}")
+            return
 
     if args.focus_region:
         try:
@@ -93,20 +151,15 @@ def main():
     print(f"Found {len(regions)} regions to refine.")
 
     # Load PDB
-    pdb_parser = PDBParser()
-    structure = pdb_parser.get_structure("protein", pdb_path)
+    structure = _PDB_PARSER.get_structure("protein", pdb_path)
     # Assuming single chain for simplicity
     chain = list(structure.get_chains())[0]
     residues = list(chain.get_residues())
     
     # Extract sequence
-    # BioPython residues to sequence... simplified
-    from Bio.SeqUtils import seq1
-    sequence = "".join([seq1(r.get_resname()) for r in residues])
+    sequence = residues_to_sequence(residues)
 
     # 2. LLM Query & 3. Geometric Refinement
-    prompt_builder = PromptBuilder()
-    
     # Client already initialized
     
     refiner = GeometricRefiner()
@@ -114,26 +167,70 @@ def main():
     # Get all CA coordinates for simple refinement
     # In a real scenario, we'd handle full atom
     ca_atoms = [r['CA'] for r in residues if 'CA' in r]
-    coords = np.array([a.get_coord() for a in ca_atoms])
+    # Fill a preallocated array from the .coord attribute (get_coord() is an extra call per atom)
+    coords = np.empty((len(ca_atoms), 3), dtype=np.float32)
+    for i, atom in enumerate(ca_atoms):
+        coords[i] = atom.coord
+    
+    # Determine Context (waits for the auto-context lookup if one is running)
+    context = args.context
+    if context_future is not None:
+        context = context_future.result()
+        debug_log.debug(f"--- AutoContext for {args.uniprot} ---")
+        debug_log.debug(f"Retrieved Context: {context}")
     
+    region_inputs = []
     for start, end in regions:
         # Extract region details
         region_seq = sequence[start:end]
-        region_plddt = plddt_scores[start:end]
-        
-        print(f"Refining region {start}-{end} ({region_seq})...")
-        
-        # Build Prompt
-        prompt = prompt_builder.build_prompt(region_seq, region_plddt, context=args.context)
+        region_plddt = plddt_scores[start:end] if plddt_scores is not None else None
+        print(f"Preparing region {start}-{end} ({region_seq})...")
+        region_inputs.append((region_seq, region_plddt, start))
+    
+    # Ask for all regions in a single request when the combined prompt fits the budget
+    responses = None
+    if len(region_inputs) > 1:
+        multi_prompt = prompt_builder.build_multi_prompt(region_inputs, context=context)
+        if len(multi_prompt) // 4 <= MULTI_PROMPT_TOKEN_BUDGET:
+            print(f"Querying LLM for {len(region_inputs)} regions in one request...")
+            responses = prompt_builder.parse_multi_response(llm_client.query(multi_prompt), len(region_inputs))
+            region_prompts = [multi_prompt] * len(region_inputs)
+            if responses is None:
+                print("Combined response could not be split by region. Falling back to per-region queries.")
+            else:
+                # Regions the combined reply left out are asked about individually
+                missing = [i for i, response in enumerate(responses) if response is None]
+                if missing:
+                    print(f"Combined response is missing {len(missing)} region(s). Querying them individually...")
+                    for i in missing:
+                        region_seq, region_plddt, _ = region_inputs[i]
+                        region_prompts[i] = prompt_builder.build_prompt(region_seq, region_plddt, context=context)
+                    retried = asyncio.run(llm_client.arun_regions([region_prompts[i] for i in missing],
+                                                                  max_concurrency=LLM_MAX_CONCURRENCY))
+                    for i, response in zip(missing, retried):
+                        responses[i] = response
+    
+    if responses is None:
+        # Build all prompts upfront so the LLM round-trips can overlap
+        region_prompts = [
+            prompt_builder.build_prompt(region_seq, region_plddt, context=context)
+            for region_seq, region_plddt, _ in region_inputs
+        ]
         
         # Query LLM
-        print("Querying LLM...")
-        response = llm_client.query(prompt)
+        print(f"Querying LLM for {len(region_prompts)} regions...")
+        responses = asyncio.run(llm_client.arun_regions(region_prompts, max_concurrency=LLM_MAX_CONCURRENCY))
+    
+    for (start, end), prompt, response in zip(regions, region_prompts, responses):
+        print(f"Refining region {start}-{end}...")
         
-        with open("pipeline_debug.log", "a") as log:
-            log.write(f"--- Region {start}-{end} ---\n")
-            log.write(f"Prompt: {prompt[:100]}...\n")
-            log.write(f"Response: {response}\n")
+        debug_log.debug(f"--- Region {start}-{end} ---")
+        debug_log.debug(f"Prompt: {prompt[:100]}...")
+        debug_log.debug(f"Response: {response}")
+        
+        if isinstance(response, Exception):
+            print(f"LLM query raised {response.__class__.__name__}: {response}")
+            response = None
             
         if not response:
             print("LLM query failed. Skipping.")
@@ -168,8 +265,7 @@ def main():
                             'value': float(dist)
                         })
                         print(f"  Added constraint: {idx1}-{idx2} dist={dist}")
-                        with open("pipeline_debug.log", "a") as log:
-                            log.write(f"  Applied constraint: {idx1}-{idx2} dist={dist}\n")
+                        debug_log.debug(f"  Applied constraint: {idx1}-{idx2} dist={dist}")
             except Exception as e:
                 print(f"  Failed to parse constraint {c}: {e}")
 
@@ -200,30 +296,51 @@ def main():
     # Save intermediate
     io = PDBIO()
     io.set_structure(structure)
-    intermediate_pdb = "intermediate_refined.pdb"
+    intermediate_pdb = os.path.join(args.workdir, "intermediate_refined.pdb")
     io.save(intermediate_pdb)
 
     # 5. Physics Minimization (Optional/Fallback)
     print("Running physics minimization...")
-    minimizer = EnergyMinimizer()
-    minimizer.minimize(intermediate_pdb, args.output)
+    minimizer = EnergyMinimizer(system_cache_dir=os.path.join("data", "openmm_systems"))
+    
+    # A ground truth given as a PDB ID may still need downloading
+    rcsb = None
+    gt_download_pending = False
+    if args.ground_truth and not os.path.exists(args.ground_truth):
+        from src.utils.data_fetcher import RCSBFetcher
+        rcsb = RCSBFetcher()
+        gt_download_pending = not os.path.exists(rcsb.local_path(args.ground_truth))
+    
+    minimize_process = None
+    if gt_download_pending:
+        # Runs in a separate process so the ground truth can be downloaded in the meantime.
+        # Spawn rather than fork: by now the LLM clients (gRPC for Gemini) and worker threads
+        # are running, which aren't fork-safe. The child re-imports main, so this only pays
+        # off when there is a download to overlap.
+        minimize_process = mp.get_context("spawn").Process(target=minimizer.minimize, args=(intermediate_pdb, args.output))
+        minimize_process.start()
+    else:
+        minimizer.minimize(intermediate_pdb, args.output)
     
     # 6. Evaluation (Optional)
+    gt_path = None
+    if args.ground_truth:
+        # Either a file path or a PDB ID to fetch
+        gt_path = rcsb.fetch(args.ground_truth) if rcsb else args.ground_truth
+    
+    # The refined structure is only final once minimization has finished
+    if minimize_process is not None:
+        minimize_process.join()
+        if minimize_process.exitcode != 0:
+            print(f"Error: minimization process exited with code {minimize_process.exitcode}.")
+            return
+    
     if args.ground_truth:
         from src.analysis.evaluator import Evaluator
-        from src.utils.data_fetcher import RCSBFetcher
         
         print("\n--- Evaluation ---")
         evaluator = Evaluator()
         
-        # Check if ground_truth is a file path or a PDB ID
-        if os.path.exists(args.ground_truth):
-            gt_path = args.ground_truth
-        else:
-            # Assume it's a PDB ID and fetch it
-            rcsb = RCSBFetcher()
-            gt_path = rcsb.fetch(args.ground_truth)
-            
         if gt_path:
             results = evaluator.compare(gt_path, pdb_path, args.output, gt_chain=args.gt_chain)
             print(f"RMSD (Original vs Ground Truth): {results['rmsd_original']:.3f} A")
@@ -235,7 +352,7 @@ def main():
             else:
                 print("Note: Refined model drifted further (or ground truth covers different domain).")
                 
-            with open("evaluation_results.txt", "w") as f:
+            with open(args.eval_out, "w") as f:
                 f.write(f"RMSD_Original: {results['rmsd_original']:.3f}\n")
                 f.write(f"RMSD_Refined: {results['rmsd_refined']:.3f}\n")
                 f.write(f"Improvement: {results['improvement']:.3f}\n")
@@ -2,14 +2,14 @@ import csv
 import subprocess
 import pandas as pd
 import os
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import argparse
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def run_benchmark(row, use_auto_context=False):
+def run_benchmark(row, use_auto_context=False, runs_dir="benchmark_runs"):
     uniprot_id = row['uniprot_id']
     gt_pdb = row['ground_truth_pdb']
     gt_chain = row['gt_chain']
@@ -18,6 +18,16 @@ def run_benchmark(row, use_auto_context=False):
     
     print(f"--- Running Benchmark for {uniprot_id} (GT: {gt_pdb}) ---")
     
+    # Isolate intermediate files per target so concurrent runs don't clobber each other.
+    # Some proteins are benchmarked against several structures, so key on both IDs.
+    workdir = os.path.join(runs_dir, f"{uniprot_id}_{gt_pdb}")
+    os.makedirs(workdir, exist_ok=True)
+    eval_out = os.path.join(workdir, f"evaluation_results_{uniprot_id}.txt")
+    print(f"Writing outputs for {uniprot_id} to {workdir}")
+    # Don't report a previous run's numbers if this one stops before evaluating
+    if os.path.exists(eval_out):
+        os.remove(eval_out)
+    
     cmd = [
         r".\venv\Scripts\python", "main.py",
         "--uniprot", uniprot_id,
@@ -26,6 +36,9 @@ def run_benchmark(row, use_auto_context=False):
         "--ground_truth", gt_pdb,
         "--ground_truth", gt_pdb,
         "--gt_chain", gt_chain,
+        "--output", os.path.join(workdir, "refined_structure.pdb"),
+        "--eval_out", eval_out,
+        "--workdir", workdir,
     ]
 
     if pd.notna(focus_region) and str(focus_region).strip():
@@ -36,17 +49,13 @@ def run_benchmark(row, use_auto_context=False):
     else:
         cmd.extend(["--context", context])
     
-    # Clean up previous results
-    if os.path.exists("evaluation_results.txt"):
-        os.remove("evaluation_results.txt")
-
     try:
         # Run the pipeline
         subprocess.run(cmd, check=True)
         
         # Read the result
-        if os.path.exists("evaluation_results.txt"):
-            with open("evaluation_results.txt", "r") as f:
+        if os.path.exists(eval_out):
+            with open(eval_out, "r") as f:
                 lines = f.readlines()
                 # Parse RMSD values
                 rmsd_orig = float(lines[0].split(":")[1].strip())
@@ -54,7 +63,7 @@ def run_benchmark(row, use_auto_context=False):
                 improvement = float(lines[2].split(":")[1].strip())
                 return rmsd_orig, rmsd_refined, improvement
         else:
-            print(f"Error: evaluation_results.txt not generated for {uniprot_id}.")
+            print(f"Error: {eval_out} not generated for {uniprot_id}.")
             return None, None, None
             
     except subprocess.CalledProcessError as e:
@@ -67,28 +76,37 @@ def run_benchmark(row, use_auto_context=False):
 def main():
     parser = argparse.ArgumentParser(description="Run Benchmark Suite")
     parser.add_argument("--auto_context", action="store_true", help="Use automated context retrieval instead of CSV context")
+    parser.add_argument("--workers", type=int, default=4, help="Number of benchmark targets to run concurrently")
+    parser.add_argument("--runs_dir", type=str, default="benchmark_runs", help="Directory for per-target outputs (refined PDB, debug log, evaluation)")
     args = parser.parse_args()
 
     benchmarks = pd.read_csv("benchmarks.csv")
-    results = []
+    results = {}
     
-    for _, row in benchmarks.iterrows():
-        rmsd_orig, rmsd_refined, improvement = run_benchmark(row, use_auto_context=args.auto_context)
-        
-        result_entry = {
-            "uniprot_id": row['uniprot_id'],
-            "target": row['ground_truth_pdb'],
-            "rmsd_original": rmsd_orig,
-            "rmsd_refined": rmsd_refined,
-            "improvement": improvement,
-            "status": "Success" if improvement is not None else "Failed"
+    # Each run is independent and dominated by LLM latency, so run them concurrently.
+    # max_workers bounds the number of in-flight pipelines (and hence API load).
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(run_benchmark, row, args.auto_context, args.runs_dir): (idx, row)
+            for idx, row in benchmarks.iterrows()
         }
-        results.append(result_entry)
-        print(f"Result: {result_entry}\n")
-        time.sleep(2) # Brief pause
+        for future in as_completed(futures):
+            idx, row = futures[future]
+            rmsd_orig, rmsd_refined, improvement = future.result()
+            
+            result_entry = {
+                "uniprot_id": row['uniprot_id'],
+                "target": row['ground_truth_pdb'],
+                "rmsd_original": rmsd_orig,
+                "rmsd_refined": rmsd_refined,
+                "improvement": improvement,
+                "status": "Success" if improvement is not None else "Failed"
+            }
+            results[idx] = result_entry
+            print(f"Result: {result_entry}\n")
         
-    # Save results
-    df = pd.DataFrame(results)
+    # Save results (in benchmark order)
+    df = pd.DataFrame([results[idx] for idx in sorted(results)])
     df.to_csv("benchmark_results.csv", index=False)
     print("\n--- Benchmark Suite Completed ---")
     print(df)
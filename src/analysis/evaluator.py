@@ -1,5 +1,17 @@
 import numpy as np
+from contextlib import contextmanager
 from Bio.PDB import Superimposer, PDBParser
+from src.utils.sequence import residues_to_sequence
+try:
+    import parasail
+    PARASAIL_AVAILABLE = True
+except ImportError:
+    PARASAIL_AVAILABLE = False
+
+# Global alignment scoring: match 2, mismatch -1, gap open -0.5, gap extend -0.1.
+# parasail only takes integer scores, so it uses the same scheme scaled by 10.
+ALIGN_SCALE = 10
+_PARASAIL_MATRIX = None
 
 class Evaluator:
     """
@@ -7,6 +19,21 @@ class Evaluator:
     """
     def __init__(self):
         self.parser = PDBParser(QUIET=True)
+        # id(structure) -> (sequence, CA residues). The cached residues hold a
+        # reference back to their structure, so an id cannot be reused while cached.
+        # Only filled inside _seq_cache_scope and cleared when the outermost scope exits.
+        self._seq_cache = {}
+        self._seq_cache_depth = 0
+
+    @contextmanager
+    def _seq_cache_scope(self):
+        self._seq_cache_depth += 1
+        try:
+            yield
+        finally:
+            self._seq_cache_depth -= 1
+            if not self._seq_cache_depth:
+                self._seq_cache.clear()
 
     def load_structure(self, pdb_path, model_id=0, chain_id=None):
         structure = self.parser.get_structure("struct", pdb_path)
@@ -21,22 +48,75 @@ class Evaluator:
 
     def calculate_rmsd(self, ref_structure, mobile_structure, atoms_to_use=None):
         """
-        Aligns mobile_structure to ref_structure and calculates RMSD.
+        Calculates the CA RMSD of mobile_structure after optimal superposition onto ref_structure.
         Uses sequence alignment to map residues between structures.
+        Only the RMSD is needed, so mobile_structure's coordinates are left untouched.
         """
-        from Bio import Align
-        from Bio.SeqUtils import seq1
-
-        # Helper to get sequence and residues
+        # Helper to get sequence and residues (memoized per structure)
         def get_seq_and_res(structure):
+            key = id(structure)
+            if key in self._seq_cache:
+                return self._seq_cache[key]
             residues = [r for r in structure.get_residues() if 'CA' in r]
-            seq = "".join([seq1(r.get_resname()) for r in residues])
+            seq = residues_to_sequence(residues)
+            self._seq_cache[key] = (seq, residues)
             return seq, residues
 
-        ref_seq, ref_residues = get_seq_and_res(ref_structure)
-        mob_seq, mob_residues = get_seq_and_res(mobile_structure)
+        with self._seq_cache_scope():
+            ref_seq, ref_residues = get_seq_and_res(ref_structure)
+            mob_seq, mob_residues = get_seq_and_res(mobile_structure)
+
+        # Align sequences and map residues based on the alignment
+        ref_atoms = []
+        mobile_atoms = []
+        for r_idx, m_idx in self._aligned_index_pairs(ref_seq, mob_seq):
+            ref_atoms.append(ref_residues[r_idx]['CA'])
+            mobile_atoms.append(mob_residues[m_idx]['CA'])
+
+        if not ref_atoms:
+            print("No common CA atoms found for RMSD.")
+            return float('inf')
+            
+        print(f"Aligned {len(ref_atoms)} residues for RMSD calculation.")
+
+        super_imposer = Superimposer()
+        super_imposer.set_atoms(ref_atoms, mobile_atoms)
+        
+        return super_imposer.rms
+
+    def _aligned_index_pairs(self, ref_seq, mob_seq):
+        """
+        Globally aligns two sequences and returns (ref_idx, mob_idx) pairs for
+        every aligned (non-gap) column. Uses parasail's SIMD aligner when
+        available, otherwise BioPython's PairwiseAligner.
+        """
+        if not ref_seq or not mob_seq:
+            return []
+
+        if PARASAIL_AVAILABLE:
+            global _PARASAIL_MATRIX
+            if _PARASAIL_MATRIX is None:
+                _PARASAIL_MATRIX = parasail.matrix_create(
+                    "ABCDEFGHIJKLMNOPQRSTUVWXYZ", 2 * ALIGN_SCALE, -1 * ALIGN_SCALE)
+            # parasail takes positive penalties for gap open/extend
+            result = parasail.nw_trace_scan_sat(
+                mob_seq, ref_seq, int(0.5 * ALIGN_SCALE), int(0.1 * ALIGN_SCALE), _PARASAIL_MATRIX)
+            traceback = result.traceback
+
+            # Walk both aligned strings jointly, advancing each index on non-gap characters
+            pairs = []
+            r_idx = m_idx = 0
+            for r_char, m_char in zip(traceback.ref, traceback.query):
+                if r_char != '-' and m_char != '-':
+                    pairs.append((r_idx, m_idx))
+                if r_char != '-':
+                    r_idx += 1
+                if m_char != '-':
+                    m_idx += 1
+            return pairs
+
+        from Bio import Align
 
-        # Align sequences
         aligner = Align.PairwiseAligner()
         aligner.mode = 'global'
         aligner.match_score = 2
@@ -47,21 +127,10 @@ class Evaluator:
         alignments = aligner.align(ref_seq, mob_seq)
         alignment = alignments[0] # Take best alignment
         
-        # Map residues based on alignment
-        ref_atoms = []
-        mobile_atoms = []
-        
-        # Iterate through alignment indices
-        # alignment.indices is (indices1, indices2)
-        # But simpler to walk the alignment
-        
         # alignment.aligned is tuple of two lists of (start, end) tuples
         ref_aligned_segments, mob_aligned_segments = alignment.aligned
         
-        # We need to iterate and collect atoms
-        # This is slightly complex with segments, let's iterate character by character?
-        # No, segments are easier.
-        
+        pairs = []
         for (r_start, r_end), (m_start, m_end) in zip(ref_aligned_segments, mob_aligned_segments):
             # Lengths should be equal for aligned segments
             length = r_end - r_start
@@ -70,31 +139,18 @@ class Evaluator:
                  continue
                  
             for i in range(length):
-                r_idx = r_start + i
-                m_idx = m_start + i
-                
-                ref_atoms.append(ref_residues[r_idx]['CA'])
-                mobile_atoms.append(mob_residues[m_idx]['CA'])
-
-        if not ref_atoms:
-            print("No common CA atoms found for RMSD.")
-            return float('inf')
-            
-        print(f"Aligned {len(ref_atoms)} residues for RMSD calculation.")
-
-        super_imposer = Superimposer()
-        super_imposer.set_atoms(ref_atoms, mobile_atoms)
-        super_imposer.apply(mobile_structure.get_atoms())
-        
-        return super_imposer.rms
+                pairs.append((r_start + i, m_start + i))
+        return pairs
 
     def compare(self, ground_truth_path, original_path, refined_path, gt_chain=None):
         gt = self.load_structure(ground_truth_path, chain_id=gt_chain)
         orig = self.load_structure(original_path) # Original usually single chain AF model
         refined = self.load_structure(refined_path)
         
-        rmsd_orig = self.calculate_rmsd(gt, orig)
-        rmsd_refined = self.calculate_rmsd(gt, refined)
+        # The ground truth is shared by both comparisons, so it is only walked once
+        with self._seq_cache_scope():
+            rmsd_orig = self.calculate_rmsd(gt, orig)
+            rmsd_refined = self.calculate_rmsd(gt, refined)
         
         return {
             "rmsd_original": rmsd_orig,
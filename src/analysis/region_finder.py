@@ -1,7 +1,8 @@
-import json
 import numpy as np
 from Bio.PDB import PDBParser
 import os
+from src.utils.atomic_write import atomic_write
+from src.utils.fast_json import loads as json_loads
 
 class RegionFinder:
     """
@@ -27,39 +28,53 @@ class RegionFinder:
         Returns:
             list of tuples: [(start_idx, end_idx), ...] 0-indexed, exclusive end.
         """
-        scores = np.array(plddt_scores)
-        mask = scores < self.plddt_threshold
+        mask = (np.asarray(plddt_scores) < self.plddt_threshold).astype(np.int8)
         
-        # Find contiguous regions in the mask
-        regions = []
-        if not np.any(mask):
-            return regions
-            
-        # Pad with False to detect edges
-        padded_mask = np.concatenate(([False], mask, [False]))
-        # Find where mask changes from False to True (start) and True to False (end)
-        starts = np.where(padded_mask[:-1] != padded_mask[1:])[0][::2]
-        ends = np.where(padded_mask[:-1] != padded_mask[1:])[0][1::2]
+        # Pad with 0 so every region has both a rising and a falling edge.
+        # The edges then alternate start, end, start, end...
+        padded_mask = np.concatenate(([0], mask, [0]))
+        edges = np.flatnonzero(np.diff(padded_mask)).reshape(-1, 2)
         
-        for s, e in zip(starts, ends):
-            if (e - s) >= self.min_length:
-                regions.append((s, e))
-                
-        return regions
+        lengths = edges[:, 1] - edges[:, 0]
+        keep = lengths >= self.min_length
+        return list(map(tuple, edges[keep]))
 
     def load_confidence_json(self, json_path):
-        """Loads pLDDT scores from an AlphaFold JSON file."""
-        with open(json_path, 'r') as f:
-            data = json.load(f)
+        """
+        Loads pLDDT scores from an AlphaFold JSON file as a float32 array
+        (a read-only np.memmap when the sidecar is reused).
+        
+        The parsed scores are cached next to the JSON as a .npy sidecar; later
+        loads memory-map the sidecar instead of re-parsing the JSON.
+        """
+        npy_path = json_path + '.npy'
+        if os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(json_path):
+            try:
+                return np.load(npy_path, mmap_mode='r')
+            except (OSError, ValueError) as e:
+                # Unreadable sidecar; re-parse the JSON and overwrite it below
+                print(f"Warning: ignoring unreadable pLDDT cache {npy_path}: {e}")
+
+        with open(json_path, 'rb') as f:
+            data = json_loads(f.read())
         
         # AlphaFold JSON structure usually has 'plddt' key
         if 'plddt' in data:
-            return data['plddt']
+            scores = np.asarray(data['plddt'], dtype=np.float32)
         elif 'confidenceScore' in data:
-            return data['confidenceScore']
-        # Sometimes it might be nested or different format depending on version
-        # Fallback or error handling could go here
-        raise ValueError(f"Could not find 'plddt' or 'confidenceScore' key in {json_path}")
+            scores = np.asarray(data['confidenceScore'], dtype=np.float32)
+        else:
+            # Sometimes it might be nested or different format depending on version
+            # Fallback or error handling could go here
+            raise ValueError(f"Could not find 'plddt' or 'confidenceScore' key in {json_path}")
+
+        # Write to a temp file and swap it in so readers never see a partial sidecar
+        try:
+            with atomic_write(npy_path, 'wb') as f:
+                np.save(f, scores)
+        except OSError as e:
+            print(f"Warning: could not cache pLDDT scores to {npy_path}: {e}")
+        return scores
 
     def analyze(self, json_path):
         """
@@ -70,9 +85,11 @@ class RegionFinder:
             
         Returns:
             dict: {
-                'plddt_scores': [...],
+                'plddt_scores': np.array of float32 scores,
                 'regions': [(start, end), ...]
             }
+            When the .npy sidecar is reused, 'plddt_scores' is a read-only
+            np.memmap; copy it before modifying it.
         """
         scores = self.load_confidence_json(json_path)
         regions = self.find_regions_from_scores(scores)
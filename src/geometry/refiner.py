@@ -1,75 +1,77 @@
-import torch
 import numpy as np
 
 class GeometricRefiner:
     """
     Refines protein coordinates based on geometric constraints and LLM priors.
-    Uses PyTorch for optimization.
+    Distance constraints are enforced by iterative projection: every sweep moves
+    the endpoints of each constraint along the axis between them to hit the target.
     """
-    def __init__(self, learning_rate=0.01, num_steps=100):
-        self.learning_rate = learning_rate
-        self.num_steps = num_steps
+    def __init__(self, num_sweeps=200, tol=1e-3):
+        """
+        Args:
+            num_sweeps (int): Maximum number of projection sweeps.
+            tol (float): Stop once every constraint is within this many Angstroms of its target.
+        """
+        self.num_sweeps = num_sweeps
+        self.tol = tol
 
     def refine(self, initial_coords, constraints, mask=None):
         """
         Refines the coordinates.
-        
+
         Args:
             initial_coords (np.array): (N, 3) array of atomic coordinates.
             constraints (list): List of constraint dicts (e.g., {'type': 'distance', 'indices': [i, j], 'value': d}).
             mask (np.array, optional): Boolean mask of residues/atoms to move. If None, move all.
-            
+
         Returns:
             np.array: Refined coordinates.
         """
-        # Convert to tensor
-        coords = torch.tensor(initial_coords, dtype=torch.float32, requires_grad=True)
-        optimizer = torch.optim.Adam([coords], lr=self.learning_rate)
-        
-        initial_coords_tensor = torch.tensor(initial_coords, dtype=torch.float32)
-        
-        for step in range(self.num_steps):
-            optimizer.zero_grad()
-            loss = torch.tensor(0.0)
-            
-            # 1. Constraint Loss
-            for constraint in constraints:
-                if constraint['type'] == 'distance':
-                    idx1, idx2 = constraint['indices']
-                    target_dist = constraint['value']
-                    current_dist = torch.norm(coords[idx1] - coords[idx2])
-                    loss += (current_dist - target_dist) ** 2
-            
-            # 2. Restraint Loss (keep atoms close to original positions unless moved)
-            # If mask is provided, we only allow masked atoms to move freely, 
-            # others should be heavily restrained or frozen.
-            # Here we implement a soft restraint for unmasked atoms.
-            if mask is not None:
-                # mask is 1 for moving, 0 for fixed
-                # We want to penalize movement of fixed atoms
-                # deviation = (coords - initial_coords_tensor)
-                # fixed_deviation = deviation[~mask]
-                # loss += 100.0 * torch.sum(fixed_deviation ** 2)
-                pass # Simplified for now, assuming optimizer only updates if we handle gradients correctly
-            
-            # 3. Geometry Loss (Bond lengths)
-            # Simplified: Maintain distance between adjacent atoms (assuming CA trace for now)
-            # In a full atom model, this would be more complex.
-            # for i in range(len(coords) - 1):
-            #     bond_len = torch.norm(coords[i] - coords[i+1])
-            #     loss += (bond_len - 3.8) ** 2 # CA-CA distance approx 3.8A
-            
-            if loss.requires_grad:
-                loss.backward()
-                
-                # Apply mask to gradients: zero out gradients for fixed atoms
-                if mask is not None:
-                    mask_tensor = torch.tensor(mask, dtype=torch.bool)
-                    coords.grad[~mask_tensor] = 0.0
-                    
-                optimizer.step()
-            else:
-                # No constraints/loss, nothing to optimize
-                pass
-            
-        return coords.detach().numpy()
+        coords = np.array(initial_coords, dtype=np.float32)
+        if mask is None:
+            mask = np.ones(len(coords), dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+
+        distance_constraints = [c for c in constraints if c['type'] == 'distance']
+        idx1 = np.array([c['indices'][0] for c in distance_constraints], dtype=np.int64)
+        idx2 = np.array([c['indices'][1] for c in distance_constraints], dtype=np.int64)
+        targets = np.array([c['value'] for c in distance_constraints], dtype=np.float32)
+
+        # Share each correction between the endpoints that are allowed to move.
+        # If only one end is masked it takes the full correction; constraints
+        # between two frozen atoms are dropped.
+        m1 = mask[idx1].astype(np.float32)
+        m2 = mask[idx2].astype(np.float32)
+        movable = (m1 + m2) > 0
+        if not movable.any():
+            # No constraints involve movable atoms, nothing to optimize
+            return coords
+        idx1, idx2, targets = idx1[movable], idx2[movable], targets[movable]
+        m1, m2 = m1[movable], m2[movable]
+        w1 = m1 / (m1 + m2)
+        w2 = m2 / (m1 + m2)
+
+        # Atoms touched by several constraints move by the average of their
+        # corrections (Jacobi-style), which keeps shared atoms from overshooting.
+        counts = np.zeros(len(coords), dtype=np.float32)
+        np.add.at(counts, idx1, (w1 > 0).astype(np.float32))
+        np.add.at(counts, idx2, (w2 > 0).astype(np.float32))
+        counts = np.maximum(counts, 1.0)[:, None]
+
+        for sweep in range(self.num_sweeps):
+            d = coords[idx2] - coords[idx1]
+            current_dists = np.linalg.norm(d, axis=1)
+            violation = current_dists - targets
+            if np.max(np.abs(violation)) < self.tol:
+                break
+
+            # Coincident endpoints have no defined axis; leave them alone
+            scale = np.where(current_dists > 1e-6, violation / np.maximum(current_dists, 1e-6), 0.0)
+            correction = scale[:, None] * d
+
+            delta = np.zeros_like(coords)
+            np.add.at(delta, idx1, w1[:, None] * correction)
+            np.add.at(delta, idx2, -w2[:, None] * correction)
+            coords += delta / counts
+
+        return coords
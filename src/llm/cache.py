@@ -0,0 +1,94 @@
+import json
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from .client import LLMClient
+from src.utils.fast_json import loads as json_loads
+
+class CachedLLMClient(LLMClient):
+    """
+    Wraps any LLMClient with a persistent on-disk response cache.
+    Responses are stored in SQLite keyed by a hash of provider, model and prompt,
+    so re-running the pipeline on the same protein skips the LLM round-trip.
+    Keys seen during this process are also held in memory to skip the database.
+    """
+    def __init__(self, inner: LLMClient, cache_path=".llm_cache.db", timeout=30.0):
+        self.inner = inner
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        # key -> serialized response; parsed on every hit so callers get their own copy
+        self._memory = {}
+        # Benchmark runs share the database across processes, so wait longer than
+        # sqlite's default 5 s for another writer's lock
+        try:
+            self._conn = sqlite3.connect(cache_path, timeout=timeout, check_same_thread=False)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: LLM cache {cache_path} unavailable ({e}), caching in memory only.")
+            self._conn = None
+
+    def _key(self, prompt):
+        provider = self.inner.__class__.__name__
+        model = getattr(self.inner, "model_name", None) or getattr(self.inner, "model", "")
+        return hashlib.sha256(f"{provider}|{model}|{prompt}".encode()).hexdigest()
+
+    def _get(self, key):
+        with self._lock:
+            serialized = self._memory.get(key)
+            if serialized is None:
+                if self._conn is None:
+                    return None
+                try:
+                    row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    # A busy or broken cache only costs us the hit
+                    print(f"Warning: LLM cache read failed ({e}), querying the model instead.")
+                    return None
+                if row is None:
+                    return None
+                serialized = self._memory[key] = row[0]
+        return json_loads(serialized)
+
+    def _set(self, key, response):
+        serialized = json.dumps(response)
+        with self._lock:
+            self._memory[key] = serialized
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute("INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)", (key, serialized))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                # Never lose a successful response because it couldn't be persisted
+                print(f"Warning: LLM cache write failed ({e}), response not persisted.")
+                try:
+                    self._conn.rollback()
+                except sqlite3.Error:
+                    pass
+
+    def query(self, prompt):
+        key = self._key(prompt)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+
+        response = self.inner.query(prompt)
+        # Failed queries return None; don't cache them so the next run retries
+        if response is not None:
+            self._set(key, response)
+        return response
+
+    async def aquery(self, prompt):
+        # SQLite calls can wait up to the busy timeout on another process's
+        # write lock, so keep them off the event loop
+        key = self._key(prompt)
+        cached = await asyncio.to_thread(self._get, key)
+        if cached is not None:
+            return cached
+
+        response = await self.inner.aquery(prompt)
+        if response is not None:
+            await asyncio.to_thread(self._set, key, response)
+        return response
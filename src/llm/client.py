@@ -1,12 +1,45 @@
 import os
+import re
 import json
+import time
+import asyncio
+import logging
 from abc import ABC, abstractmethod
+from .throttle import RateLimiter
+from src.utils.fast_json import loads as json_loads
+
+# Pipeline debug log; main.py attaches the file handler
+debug_log = logging.getLogger("pipeline_debug")
+
+# Markdown code fence around a JSON payload, with optional language tag and surrounding whitespace.
+# The closing fence is optional since truncated replies sometimes drop it.
+_FENCE_RE = re.compile(r'^\s*```(?:json)?\s*\n?(.*?)\n?\s*(?:```)?\s*$', re.DOTALL | re.IGNORECASE)
 
 class LLMClient(ABC):
     @abstractmethod
     def query(self, prompt):
         pass
 
+    async def aquery(self, prompt):
+        """
+        Async variant of query. Clients without a native async API
+        run the blocking query in a worker thread.
+        """
+        return await asyncio.to_thread(self.query, prompt)
+
+    async def arun_regions(self, region_prompts, max_concurrency=8):
+        """
+        Queries all region prompts concurrently, with at most max_concurrency in flight.
+        Results come back in prompt order; a query that raised is returned as its exception.
+        """
+        sem = asyncio.Semaphore(max_concurrency)
+
+        async def _one(prompt):
+            async with sem:
+                return await self.aquery(prompt)
+
+        return await asyncio.gather(*[_one(p) for p in region_prompts], return_exceptions=True)
+
 class MockLLMClient(LLMClient):
     """
     Mock client for testing without API keys.
@@ -23,8 +56,10 @@ class MockLLMClient(LLMClient):
 class OpenAIClient(LLMClient):
     """
     Client for OpenAI API.
+    Requests go through a RateLimiter, which also handles retries,
+    so the SDK's own retry loop is disabled.
     """
-    def __init__(self, api_key=None, model="gpt-4o"):
+    def __init__(self, api_key=None, model="gpt-4o", limiter=None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.model = model
         if not self.api_key:
@@ -32,29 +67,168 @@ class OpenAIClient(LLMClient):
         
         # Import here to avoid dependency if not used
         import openai
-        self.client = openai.OpenAI(api_key=self.api_key)
+        self.client = openai.OpenAI(api_key=self.api_key, max_retries=0)
+        self.aclient = openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        self.limiter = limiter or RateLimiter()
+
+    @staticmethod
+    def _messages(prompt):
+        return [
+            {"role": "system", "content": "You are a helpful assistant that outputs JSON."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _query_once(self, prompt):
+        raw = self.client.chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            response_format={"type": "json_object"}
+        )
+        self.limiter.update_from_headers(raw.headers)
+        return raw.parse()
+
+    async def _aquery_once(self, prompt):
+        raw = await self.aclient.chat.completions.with_raw_response.create(
+            model=self.model,
+            messages=self._messages(prompt),
+            response_format={"type": "json_object"}
+        )
+        self.limiter.update_from_headers(raw.headers)
+        return raw.parse()
 
     def query(self, prompt):
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that outputs JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                response_format={"type": "json_object"}
-            )
+            response = self.limiter.call(self._query_once, prompt, estimated_tokens=len(prompt) // 4)
             content = response.choices[0].message.content
-            return json.loads(content)
+            debug_log.debug("RAW LLM RESPONSE:\n%s", content)
+            return json_loads(content)
         except Exception as e:
             print(f"Error querying OpenAI: {e}")
             return None
 
+    async def aquery(self, prompt):
+        try:
+            response = await self.limiter.acall(self._aquery_once, prompt, estimated_tokens=len(prompt) // 4)
+            content = response.choices[0].message.content
+            debug_log.debug("RAW LLM RESPONSE:\n%s", content)
+            return json_loads(content)
+        except Exception as e:
+            print(f"Error querying OpenAI: {e}")
+            return None
+
+class OpenAIBatchClient(LLMClient):
+    """
+    Client for the OpenAI Batch API, for offline bulk jobs such as precomputing
+    context for many proteins. Batched requests cost about half as much as
+    synchronous ones but only complete within the 24h window, so use
+    submit_batch / poll / fetch_results rather than query for large jobs.
+    """
+    ENDPOINT = "/v1/chat/completions"
+    TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(self, api_key=None, model="gpt-4o", poll_interval=30):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.model = model
+        self.poll_interval = poll_interval
+        if not self.api_key:
+            raise ValueError("OpenAI API key not found.")
+
+        import openai
+        self.client = openai.OpenAI(api_key=self.api_key)
+
+    def _request_line(self, index, prompt):
+        return {
+            "custom_id": f"req-{index}",
+            "method": "POST",
+            "url": self.ENDPOINT,
+            "body": {
+                "model": self.model,
+                "messages": OpenAIClient._messages(prompt),
+                "response_format": {"type": "json_object"}
+            }
+        }
+
+    def submit_batch(self, prompts):
+        """
+        Uploads one chat completion request per prompt and starts a batch job.
+
+        Returns:
+            str: The batch ID, for poll and fetch_results.
+        """
+        lines = "\n".join(json.dumps(self._request_line(i, p)) for i, p in enumerate(prompts))
+        batch_file = self.client.files.create(file=("batch.jsonl", lines.encode("utf-8")), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=self.ENDPOINT,
+            completion_window="24h"
+        )
+        print(f"Submitted batch {batch.id} with {len(prompts)} requests")
+        return batch.id
+
+    def poll(self, batch_id):
+        """Returns the batch status (e.g. "validating", "in_progress", "completed")."""
+        return self.client.batches.retrieve(batch_id).status
+
+    def wait(self, batch_id):
+        """Blocks until the batch reaches a terminal status and returns it."""
+        while True:
+            status = self.poll(batch_id)
+            if status in self.TERMINAL_STATUSES:
+                return status
+            time.sleep(self.poll_interval)
+
+    def fetch_results(self, batch_id):
+        """
+        Downloads the results of a finished batch.
+
+        Returns:
+            list: One parsed JSON response per submitted prompt, in submission order.
+                Requests that failed or returned invalid JSON are None.
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        results = [None] * batch.request_counts.total if batch.request_counts else []
+        if not batch.output_file_id:
+            print(f"Batch {batch_id} has no output (status: {batch.status})")
+            return results
+
+        output = self.client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            record = json_loads(line)
+            index = int(record["custom_id"].split("-", 1)[1])
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                print(f"Batch request {record['custom_id']} failed: {record.get('error')}")
+                continue
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+                if index >= len(results):
+                    results.extend([None] * (index + 1 - len(results)))
+                results[index] = json_loads(content)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                print(f"Could not parse batch response {record['custom_id']}: {e}")
+        return results
+
+    def query(self, prompt):
+        """
+        Runs a single prompt as a one-request batch. Mainly for interface
+        compatibility; this can take hours.
+        """
+        try:
+            batch_id = self.submit_batch([prompt])
+            self.wait(batch_id)
+            results = self.fetch_results(batch_id)
+            return results[0] if results else None
+        except Exception as e:
+            print(f"Error querying OpenAI batch: {e}")
+            return None
+
 class GeminiClient(LLMClient):
     """
     Client for Google Gemini API.
     """
-    def __init__(self, api_key=None, model="models/gemini-2.0-flash"):
+    def __init__(self, api_key=None, model="models/gemini-2.0-flash", limiter=None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         self.model_name = model
         if not self.api_key:
@@ -63,21 +237,30 @@ class GeminiClient(LLMClient):
         import google.generativeai as genai
         genai.configure(api_key=self.api_key)
         self.model = genai.GenerativeModel(self.model_name, generation_config={"response_mime_type": "application/json"})
+        self.limiter = limiter or RateLimiter()
+
+    def _parse_response(self, text):
+        debug_log.debug("RAW LLM RESPONSE:\n%s", text)
+        # Strip markdown code blocks if present
+        match = _FENCE_RE.match(text)
+        if match:
+            text = match.group(1)
+        return json_loads(text.strip())
 
     def query(self, prompt):
         try:
-            response = self.model.generate_content(prompt)
-            text = response.text
-            with open("pipeline_debug.log", "a") as log:
-                log.write(f"RAW LLM RESPONSE:\n{text}\n")
-            # Strip markdown code blocks if present
-            if text.startswith("```json"):
-                text = text[7:]
-            if text.startswith("```"):
-                text = text[3:]
-            if text.endswith("```"):
-                text = text[:-3]
-            return json.loads(text.strip())
+            response = self.limiter.call(self.model.generate_content, prompt, estimated_tokens=len(prompt) // 4)
+            return self._parse_response(response.text)
+        except Exception as e:
+            print(f"Error querying Gemini: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+
+    async def aquery(self, prompt):
+        try:
+            response = await self.limiter.acall(self.model.generate_content_async, prompt, estimated_tokens=len(prompt) // 4)
+            return self._parse_response(response.text)
         except Exception as e:
             print(f"Error querying Gemini: {e}")
             import traceback
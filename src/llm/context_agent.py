@@ -1,46 +1,161 @@
+import os
+import json
+import asyncio
+import time
+import threading
 from .client import LLMClient
-
-import requests
+from src.utils.data_fetcher import create_session, DOWNLOAD_TIMEOUT
+from src.utils.atomic_write import atomic_write
+from src.utils.fast_json import loads as json_loads
 
 class ContextAgent:
     """
     Agent to retrieve biological context for a given protein (UniProt ID) using an LLM.
     """
+    # Shared across instances so UniProt lookups reuse the same connection
+    session = create_session()
+
+    # Protein names persisted across runs:
+    # uniprot_id -> {"name": str or None, "fetched_at": epoch seconds, "etag": str (optional)}
+    NAME_CACHE_PATH = os.path.join("data", "uniprot_names.json")
+    # Failed lookups (name None) are retried after this many seconds
+    NEGATIVE_CACHE_TTL = 3600
+    # Known names are revalidated with If-None-Match after this many seconds
+    NAME_CACHE_TTL = 30 * 24 * 3600
+
+    # In-process copy of the name cache, loaded from disk on first use
+    _name_cache = None
+    _name_cache_lock = threading.Lock()
+
     def __init__(self, client: LLMClient):
         self.client = client
 
     def fetch_protein_name(self, uniprot_id):
         """
         Fetches the protein name from UniProt API.
+        Names are cached in memory and in NAME_CACHE_PATH. Known names are
+        revalidated with a conditional request after NAME_CACHE_TTL seconds;
+        failed lookups are cached for NEGATIVE_CACHE_TTL seconds so bad IDs
+        aren't re-queried every run.
+        Falls back to the UniProt ID if no name is available.
+        """
+        with self._name_cache_lock:
+            cache = self._load_name_cache()
+            entry = cache.get(uniprot_id)
+        if entry is not None:
+            ttl = self.NAME_CACHE_TTL if entry["name"] is not None else self.NEGATIVE_CACHE_TTL
+            if time.time() - entry["fetched_at"] < ttl:
+                return entry["name"] if entry["name"] is not None else uniprot_id
+
+        name, etag = self._query_protein_name(uniprot_id, entry)
+        if name is None and entry is not None and entry["name"] is not None:
+            # Revalidation failed; keep serving the stale name rather than forgetting it
+            return entry["name"]
+        self._store_name(uniprot_id, name, etag)
+        return name if name is not None else uniprot_id
+
+    def _query_protein_name(self, uniprot_id, cached=None):
+        """
+        Looks the protein name up on UniProt.
+        If cached (a name cache entry) has an ETag, the request is conditional
+        and a 304 reuses the cached name without downloading the entry.
+
+        Returns:
+            tuple: (name, etag), with name None on failure.
         """
         url = f"https://rest.uniprot.org/uniprotkb/{uniprot_id}.json"
+        headers = None
+        if cached and cached.get("name") is not None and cached.get("etag"):
+            headers = {'If-None-Match': cached["etag"]}
         try:
-            response = requests.get(url)
+            response = self.session.get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+            if response.status_code == 304:
+                return cached["name"], cached["etag"]
             if response.status_code == 200:
-                data = response.json()
+                etag = response.headers.get('ETag')
+                data = json_loads(response.content)
                 # Try to get recommended name
                 try:
                     name = data['proteinDescription']['recommendedName']['fullName']['value']
-                    return name
+                    return name, etag
                 except KeyError:
                     # Fallback to submitted name or gene name
                     try:
                         name = data['proteinDescription']['submissionNames'][0]['fullName']['value']
-                        return name
+                        return name, etag
                     except (KeyError, IndexError):
-                         return uniprot_id # Fallback
+                         return None, None
             else:
                 print(f"UniProt API failed: {response.status_code}")
-                return uniprot_id
+                return None, None
         except Exception as e:
             print(f"Error fetching from UniProt: {e}")
-            return uniprot_id
+            return None, None
+
+    @classmethod
+    def _load_name_cache(cls):
+        if cls._name_cache is None:
+            cls._name_cache = {}
+            if os.path.exists(cls.NAME_CACHE_PATH):
+                try:
+                    with open(cls.NAME_CACHE_PATH, "rb") as f:
+                        cls._name_cache = json_loads(f.read())
+                except (OSError, ValueError) as e:
+                    print(f"Warning: ignoring unreadable UniProt name cache {cls.NAME_CACHE_PATH}: {e}")
+        return cls._name_cache
+
+    @classmethod
+    def _store_name(cls, uniprot_id, name, etag=None):
+        with cls._name_cache_lock:
+            cache = cls._load_name_cache()
+            cache[uniprot_id] = {"name": name, "fetched_at": time.time()}
+            if etag:
+                cache[uniprot_id]["etag"] = etag
+            # Write to a temp file and swap it in so a crash never leaves a truncated cache
+            try:
+                cache_dir = os.path.dirname(cls.NAME_CACHE_PATH) or "."
+                os.makedirs(cache_dir, exist_ok=True)
+                with atomic_write(cls.NAME_CACHE_PATH) as f:
+                    json.dump(cache, f, indent=2)
+            except OSError as e:
+                print(f"Warning: could not write UniProt name cache: {e}")
 
     def get_context(self, uniprot_id):
         """
         Queries the LLM to get the folding-upon-binding context for a UniProt ID.
         """
         protein_name = self.fetch_protein_name(uniprot_id)
+        prompt = self._build_context_prompt(uniprot_id, protein_name)
+        response = self.client.query(prompt)
+        return self._extract_context(response)
+
+    async def aget_context(self, uniprot_id):
+        """
+        Async variant of get_context. The UniProt lookup runs in a worker thread
+        and the LLM call uses the client's aquery.
+        """
+        protein_name = await asyncio.to_thread(self.fetch_protein_name, uniprot_id)
+        prompt = self._build_context_prompt(uniprot_id, protein_name)
+        response = await self.client.aquery(prompt)
+        return self._extract_context(response)
+
+    async def batch_get_context(self, uniprot_ids, concurrency=8):
+        """
+        Retrieves context for many proteins concurrently, with at most
+        `concurrency` lookups in flight.
+        
+        Returns:
+            list: Context summary (or None) per UniProt ID, in input order.
+        """
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _one(uniprot_id):
+            async with sem:
+                return await self.aget_context(uniprot_id)
+
+        return await asyncio.gather(*[_one(uniprot_id) for uniprot_id in uniprot_ids])
+
+    def _build_context_prompt(self, uniprot_id, protein_name):
         print(f"Identified protein: {protein_name} ({uniprot_id})")
 
         prompt = f"""
@@ -66,8 +181,9 @@ Output JSON format:
 }}
 """
         print(f"Querying LLM for detailed structural context of {protein_name}...")
-        response = self.client.query(prompt)
-        
+        return prompt
+
+    def _extract_context(self, response):
         if isinstance(response, list):
             if len(response) > 0:
                 response = response[0]
@@ -1,40 +1,23 @@
-class PromptBuilder:
-    """
-    Constructs prompts for the LLM to query biochemical priors for a specific protein region.
-    """
-    def __init__(self):
-        pass
+import string
+import numpy as np
 
-    def build_prompt(self, sequence, plddt, secondary_structure=None, context=None):
-        """
-        Creates a prompt describing the region.
-        
-        Args:
-            sequence (str): Amino acid sequence of the region.
-            plddt (list): List of pLDDT scores.
-            secondary_structure (str, optional): Predicted secondary structure (e.g., from DSSP).
-            context (str, optional): Description of the surrounding environment (e.g., "linker between two domains").
-            
-        Returns:
-            str: The formatted prompt.
-        """
-        avg_plddt = sum(plddt)/len(plddt) if plddt else 0
-        
-        prompt = f"""
+# Prompt skeletons are parsed once at import; build_prompt only substitutes values.
+_PROMPT_HEADER = string.Template("""
 You are an expert structural biologist. I have a protein region that AlphaFold predicted with low confidence (pLDDT < 50), likely due to it being an Intrinsically Disordered Region (IDR) that folds upon binding.
 
 **Biological Context:**
-{context if context else "No specific context provided."}
+$context
 
 **Region Details:**
-- **Sequence:** {sequence}
-- **Length:** {len(sequence)} residues
-- **Average pLDDT:** {avg_plddt:.2f} (Low confidence)
-"""
-        if secondary_structure:
-            prompt += f"- **Predicted Secondary Structure:** {secondary_structure}\n"
+- **Sequence:** $sequence
+- **Length:** $length residues
+""")
+
+_PLDDT_LINE = string.Template("- **Average pLDDT:** $avg_plddt (Low confidence)\n")
+
+_SS_LINE = string.Template("- **Predicted Secondary Structure:** $ss\n")
 
-        prompt += """
+_PROMPT_TASK = """
 **Task:**
 Based *strictly* on the biological context above, predict the secondary structure this region adopts when bound.
 **IMPORTANT:** Do NOT let the low pLDDT score dissuade you. The context confirms it folds.
@@ -50,4 +33,127 @@ Please provide your answer in JSON format with the following keys:
 ]
 **Important:** "residue_index_1" and "residue_index_2" should be the 1-based index within the *provided sequence snippet* (e.g., 1 is the first residue of the snippet).
 """
-        return prompt
+
+_MULTI_HEADER = string.Template("""
+You are an expert structural biologist. I have $num_regions regions of one protein that AlphaFold predicted with low confidence (pLDDT < 50), likely due to them being Intrinsically Disordered Regions (IDRs) that fold upon binding.
+
+**Biological Context:**
+$context
+
+**Regions:**
+""")
+
+_MULTI_REGION = string.Template("""
+### Region $region_id
+- **Sequence:** $sequence
+- **Position in full sequence:** $start-$end
+- **Length:** $length residues
+""")
+
+_MULTI_TASK = """
+**Task:**
+For each region, based *strictly* on the biological context above, predict the secondary structure it adopts when bound.
+**IMPORTANT:** Do NOT let the low pLDDT scores dissuade you. The context confirms it folds.
+If the context says a region forms a helix, you MUST predict a helix and generate distance constraints for it.
+
+**Output Format:**
+Please provide your answer in JSON format with a single key "regions", a list with one entry per region:
+{"regions": [
+    {
+        "region_id": int,
+        "secondary_structure_prediction": "Helix" | "Sheet" | "Loop" | "Disordered",
+        "confidence": "High" | "Medium" | "Low",
+        "reasoning": "Brief explanation...",
+        "constraints": [
+            {"residue_index_1": int, "residue_index_2": int, "distance_angstroms": float, "type": "distance"}
+        ]
+    }
+]}
+**Important:** "region_id" is the region number given above. "residue_index_1" and "residue_index_2" should be the 1-based index within *that region's* sequence snippet (e.g., 1 is the first residue of the snippet).
+"""
+
+_NO_CONTEXT = "No specific context provided."
+
+class PromptBuilder:
+    """
+    Constructs prompts for the LLM to query biochemical priors for a specific protein region.
+    """
+    def __init__(self, include_plddt=True):
+        """
+        Args:
+            include_plddt (bool): Whether prompts report pLDDT statistics for each region.
+        """
+        self.include_plddt = include_plddt
+
+    @property
+    def needs_plddt(self):
+        """True if the prompts use pLDDT scores, i.e. callers must load them."""
+        return self.include_plddt
+
+    def build_prompt(self, sequence, plddt, secondary_structure=None, context=None):
+        """
+        Creates a prompt describing the region.
+        
+        Args:
+            sequence (str): Amino acid sequence of the region.
+            plddt (list or np.array, optional): pLDDT scores. Omitted from the prompt if None.
+            secondary_structure (str, optional): Predicted secondary structure (e.g., from DSSP).
+            context (str, optional): Description of the surrounding environment (e.g., "linker between two domains").
+            
+        Returns:
+            str: The formatted prompt.
+        """
+        parts = [_PROMPT_HEADER.substitute(context=context or _NO_CONTEXT, sequence=sequence, length=len(sequence))]
+        if self.include_plddt and plddt is not None:
+            avg_plddt = float(np.mean(plddt, dtype=np.float64)) if len(plddt) else 0.0
+            parts.append(_PLDDT_LINE.substitute(avg_plddt=f"{avg_plddt:.2f}"))
+        if secondary_structure:
+            parts.append(_SS_LINE.substitute(ss=secondary_structure))
+        parts.append(_PROMPT_TASK)
+        return "".join(parts)
+
+    def build_multi_prompt(self, regions, context=None):
+        """
+        Creates a single prompt covering several regions of the same protein,
+        so the shared instructions and context are sent once.
+        
+        Args:
+            regions (list): List of (sequence, plddt, idx_offset) tuples, where idx_offset
+                is the 0-based start of the region in the full sequence. plddt may be None.
+            context (str, optional): Description of the surrounding environment.
+            
+        Returns:
+            str: The formatted prompt. Regions are numbered from 1 ("region_id").
+        """
+        parts = [_MULTI_HEADER.substitute(num_regions=len(regions), context=context or _NO_CONTEXT)]
+        for region_id, (sequence, plddt, idx_offset) in enumerate(regions, start=1):
+            parts.append(_MULTI_REGION.substitute(region_id=region_id, sequence=sequence,
+                                                  start=idx_offset + 1, end=idx_offset + len(sequence),
+                                                  length=len(sequence)))
+            if self.include_plddt and plddt is not None:
+                avg_plddt = float(np.mean(plddt, dtype=np.float64)) if len(plddt) else 0.0
+                parts.append(_PLDDT_LINE.substitute(avg_plddt=f"{avg_plddt:.2f}"))
+        parts.append(_MULTI_TASK)
+        return "".join(parts)
+
+    def parse_multi_response(self, response, num_regions):
+        """
+        Splits a response to build_multi_prompt into per-region responses.
+        
+        Returns:
+            list or None: One response dict (or None if missing) per region, in region order.
+                None if the response doesn't follow the multi-region format at all.
+        """
+        if not isinstance(response, dict) or not isinstance(response.get('regions'), list):
+            return None
+        
+        by_id = {}
+        for entry in response['regions']:
+            try:
+                by_id[int(entry['region_id'])] = entry
+            except (KeyError, TypeError, ValueError):
+                continue
+        
+        if not by_id:
+            return None
+        return [by_id.get(region_id) for region_id in range(1, num_regions + 1)]
@@ -0,0 +1,246 @@
+import re
+import sys
+import time
+import asyncio
+import threading
+from collections import deque
+
+# Status codes worth retrying: rate limits and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Status codes that mean the provider is overloaded and we should back off
+THROTTLE_STATUS = {429, 503}
+
+def _transport_error_types():
+    """
+    Exceptions raised when a request never got an HTTP response (connection
+    reset, DNS failure, timeout). They carry no status but are worth retrying.
+    Only SDKs that are already imported are checked: an error can't come from
+    a library that was never loaded, and importing them here would slow down
+    every run that doesn't use them.
+    """
+    types = [ConnectionError, TimeoutError]
+    httpx = sys.modules.get("httpx")
+    if httpx is not None:
+        types.append(httpx.TransportError)
+    openai = sys.modules.get("openai")
+    if openai is not None:
+        # Also covers openai.APITimeoutError
+        types.append(openai.APIConnectionError)
+    requests = sys.modules.get("requests")
+    if requests is not None:
+        types.extend([requests.ConnectionError, requests.Timeout])
+    return tuple(types)
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def _parse_duration(value):
+    """
+    Parses OpenAI-style reset durations ("1s", "6m0s", "120ms") or plain seconds.
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+def _error_status(error):
+    """
+    Extracts an HTTP status code from an SDK exception, if it carries one.
+    OpenAI errors expose status_code; google.api_core errors expose code.
+    """
+    for attr in ("status_code", "code"):
+        status = getattr(error, attr, None)
+        try:
+            return int(status)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def _error_retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    return _parse_duration(headers.get("retry-after"))
+
+class RateLimiter:
+    """
+    Client-side throttle for LLM requests.
+    Keeps requests and estimated tokens within a sliding window (RPM/TPM) and
+    adapts the number of in-flight requests AIMD-style: halve on 429/503,
+    grow by 0.5 on every success up to max_concurrency.
+    Failed calls with a retryable status, or that never got a response
+    (connection errors, timeouts), are retried with exponential backoff.
+    """
+    def __init__(self, rpm=None, tpm=None, max_concurrency=8, window=60.0, max_retries=5, base_delay=1.0):
+        """
+        Args:
+            rpm (int): Requests allowed per window, or None for no limit.
+            tpm (int): Estimated tokens allowed per window, or None for no limit.
+            max_concurrency (int): Upper bound on in-flight requests.
+            window (float): Sliding window length in seconds.
+            max_retries (int): Retries for 429/5xx and transport errors before giving up.
+            base_delay (float): Initial backoff in seconds, doubled on every retry.
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.window = window
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._requests = deque()
+        self._tokens = deque()
+        self._token_total = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens):
+        """
+        Reserves a slot if every limit allows it.
+        Returns 0 on success, otherwise the number of seconds to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+
+            cutoff = now - self.window
+            while self._requests and self._requests[0] <= cutoff:
+                self._requests.popleft()
+            while self._tokens and self._tokens[0][0] <= cutoff:
+                self._token_total -= self._tokens.popleft()[1]
+
+            if self.in_flight >= max(1, int(self.concurrency)):
+                return 0.05
+            if self.rpm and len(self._requests) >= self.rpm:
+                return self._requests[0] + self.window - now
+            # A single oversized request is let through once the window is empty
+            if self.tpm and self._tokens and self._token_total + tokens > self.tpm:
+                return self._tokens[0][0] + self.window - now
+
+            self._requests.append(now)
+            if tokens:
+                self._tokens.append((now, tokens))
+                self._token_total += tokens
+            self.in_flight += 1
+            return 0
+
+    def acquire(self, estimated_tokens=0):
+        """Blocks until a request may be sent."""
+        while True:
+            delay = self._try_acquire(estimated_tokens)
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def wait_if_throttled(self, estimated_tokens=0):
+        """Async variant of acquire; yields to the event loop while waiting."""
+        while True:
+            delay = self._try_acquire(estimated_tokens)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def release_slot(self):
+        """
+        Frees the slot taken by acquire without adjusting the concurrency target.
+        Used for failures that say nothing about provider load.
+        """
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def release(self, throttled=False, retry_after=None):
+        """
+        Frees the slot taken by acquire and adjusts the concurrency target.
+        """
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if throttled:
+                self.concurrency = max(1.0, self.concurrency * 0.5)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            else:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 0.5)
+
+    def update_from_headers(self, headers):
+        """
+        Reads OpenAI-style x-ratelimit-* headers and pauses until the reset
+        once fewer than 10% of the requests in the current window remain.
+        """
+        if headers is None:
+            return
+        try:
+            remaining = int(headers.get("x-ratelimit-remaining-requests"))
+            limit = int(headers.get("x-ratelimit-limit-requests"))
+        except (TypeError, ValueError):
+            return
+        if limit <= 0 or remaining >= 0.1 * limit:
+            return
+        reset = _parse_duration(headers.get("x-ratelimit-reset-requests")) or 1.0
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + reset)
+
+    def _on_error(self, error, attempt):
+        """
+        Releases the slot after a failed call.
+        Returns the backoff delay if the call should be retried, else None.
+        """
+        status = _error_status(error)
+        retry_after = _error_retry_after(error)
+        if status in THROTTLE_STATUS:
+            self.release(throttled=True, retry_after=retry_after)
+        else:
+            # Only successes grow the concurrency target
+            self.release_slot()
+        retryable = status in RETRYABLE_STATUS or (status is None and isinstance(error, _transport_error_types()))
+        if not retryable or attempt >= self.max_retries:
+            return None
+        return max(retry_after or 0.0, self.base_delay * (2 ** attempt))
+
+    def call(self, fn, *args, estimated_tokens=0, **kwargs):
+        """
+        Calls fn under the limiter, retrying 429/5xx and transport errors with exponential backoff.
+        Other exceptions (and the last retryable one) are re-raised.
+        """
+        attempt = 0
+        while True:
+            self.acquire(estimated_tokens)
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                print(f"LLM request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.release()
+            return result
+
+    async def acall(self, fn, *args, estimated_tokens=0, **kwargs):
+        """Async variant of call; fn must be a coroutine function."""
+        attempt = 0
+        while True:
+            await self.wait_if_throttled(estimated_tokens)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                print(f"LLM request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.release()
+            return result
@@ -1,4 +1,7 @@
+import os
 import sys
+import hashlib
+from src.utils.atomic_write import atomic_write
 try:
     import openmm as mm
     import openmm.app as app
@@ -13,13 +16,139 @@ except ImportError:
     except ImportError:
         OPENMM_AVAILABLE = False
 
+# Fastest first; GPU platforms run in mixed precision
+PLATFORM_PREFERENCE = ['CUDA', 'OpenCL', 'CPU', 'Reference']
+PLATFORM_PROPERTIES = {
+    'CUDA': {'Precision': 'mixed', 'DeterministicForces': 'false'},
+    'OpenCL': {'Precision': 'mixed'},
+}
+
 class EnergyMinimizer:
     """
     Performs energy minimization using OpenMM.
     """
-    def __init__(self, forcefield='amber14-all.xml', water_model='amber14/tip3p.xml'):
+    def __init__(self, forcefield='amber14-all.xml', water_model='amber14/tip3p.xml', nonbonded_cutoff=1.0,
+                 system_cache_dir=None, tolerance=100.0, max_iterations=500):
+        """
+        Args:
+            forcefield (str): OpenMM force field XML.
+            water_model (str): Water model XML.
+            nonbonded_cutoff (float): Nonbonded cutoff in nm. None uses NoCutoff (O(N^2) pair evaluation).
+            system_cache_dir (str, optional): Directory to persist serialized Systems across runs.
+            tolerance (float): Stop minimizing once the RMS force is below this, in kJ/mol/nm.
+                OpenMM's default is 10; refinement output rarely needs it that tight.
+            max_iterations (int): Cap on L-BFGS iterations. 0 means until converged.
+        """
         self.forcefield_name = forcefield
         self.water_model = water_model
+        self.nonbonded_cutoff = nonbonded_cutoff
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.system_cache_dir = system_cache_dir
+        # Loaded on first use; parsing the force field XML is expensive
+        self._forcefield = None
+        # Topology key -> System, for structures that share a topology (e.g. successive refinements)
+        self._system_cache = {}
+        # Only the platform name is kept (Platform objects can't be pickled into a worker process)
+        self.platform_name, self.platform_properties = self._select_platform() if OPENMM_AVAILABLE else (None, {})
+
+    def __getstate__(self):
+        # Sent to a spawned worker process without the force field and Systems;
+        # the worker rebuilds them (or loads them from system_cache_dir) on demand
+        state = self.__dict__.copy()
+        state['_forcefield'] = None
+        state['_system_cache'] = {}
+        return state
+
+    @staticmethod
+    def _select_platform():
+        """
+        Picks the fastest OpenMM platform available on this machine.
+
+        Returns:
+            tuple: (platform name or None, platform properties dict)
+        """
+        for name in PLATFORM_PREFERENCE:
+            try:
+                mm.Platform.getPlatformByName(name)
+            except Exception:
+                continue
+            return name, dict(PLATFORM_PROPERTIES.get(name, {}))
+        return None, {}
+
+    def _get_forcefield(self):
+        if self._forcefield is None:
+            self._forcefield = app.ForceField(self.forcefield_name, self.water_model)
+        return self._forcefield
+
+    def _topology_key(self, topology):
+        """
+        Identifies a System by everything createSystem depends on: the OpenMM
+        version, the force field settings and the chain/residue/atom layout
+        (coordinates don't matter).
+        """
+        atoms = "|".join(
+            f"{a.residue.chain.id}:{a.residue.name}{a.residue.id}:{a.name}:{a.element.symbol if a.element else ''}"
+            for a in topology.atoms()
+        )
+        bonds = "|".join(f"{bond[0].index}-{bond[1].index}" for bond in topology.bonds())
+        settings = f"{mm.Platform.getOpenMMVersion()}|{self.forcefield_name}|{self.water_model}|{self.nonbonded_cutoff}"
+        return hashlib.sha256(f"{settings}#{atoms}#{bonds}".encode()).hexdigest()
+
+    def _get_system(self, topology):
+        """
+        Returns the System for this topology, building it only on a cache miss.
+        Systems are cached in memory for repeated minimize() calls on this
+        instance and, with system_cache_dir set, on disk for later runs and
+        for minimizations in a spawned worker process.
+        """
+        key = self._topology_key(topology)
+        system = self._system_cache.get(key)
+        if system is not None:
+            return system
+
+        cache_path = None
+        if self.system_cache_dir:
+            cache_path = os.path.join(self.system_cache_dir, f"{key}.xml")
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path) as f:
+                    system = mm.XmlSerializer.deserialize(f.read())
+            except Exception as e:
+                print(f"Warning: ignoring unreadable OpenMM system cache {cache_path}: {e}")
+        if system is None:
+            # We use a simple vacuum or implicit solvent model for efficiency if explicit water isn't needed
+            # For refinement, implicit solvent (GB/SA) is often better/faster than setting up a box
+            forcefield = self._get_forcefield()
+            if self.nonbonded_cutoff is None:
+                system = forcefield.createSystem(topology, nonbondedMethod=app.NoCutoff, constraints=app.HBonds)
+            else:
+                system = forcefield.createSystem(topology, nonbondedMethod=app.CutoffNonPeriodic,
+                                                 nonbondedCutoff=self.nonbonded_cutoff*unit.nanometer,
+                                                 constraints=app.HBonds)
+            if cache_path:
+                try:
+                    os.makedirs(self.system_cache_dir, exist_ok=True)
+                    with atomic_write(cache_path) as f:
+                        f.write(mm.XmlSerializer.serialize(system))
+                except OSError as e:
+                    print(f"Warning: could not cache OpenMM system: {e}")
+
+        self._system_cache[key] = system
+        return system
+
+    def _create_simulation(self, topology, system):
+        integrator = mm.LangevinIntegrator(300*unit.kelvin, 1.0/unit.picosecond, 2.0*unit.femtoseconds)
+        if self.platform_name is None:
+            return app.Simulation(topology, system, integrator)
+        try:
+            platform = mm.Platform.getPlatformByName(self.platform_name)
+            return app.Simulation(topology, system, integrator, platform, self.platform_properties)
+        except Exception as e:
+            # GPU plugins can load without a usable device; let OpenMM choose instead
+            print(f"Warning: OpenMM platform {self.platform_name} unavailable ({e}), using default.")
+            self.platform_name, self.platform_properties = None, {}
+            return self._create_simulation(topology, system)
 
     def minimize(self, pdb_path, output_path):
         """
@@ -41,19 +170,14 @@ class EnergyMinimizer:
 
         try:
             pdb = app.PDBFile(pdb_path)
-            forcefield = app.ForceField(self.forcefield_name, self.water_model)
-            
-            # Create system
-            # We use a simple vacuum or implicit solvent model for efficiency if explicit water isn't needed
-            # For refinement, implicit solvent (GB/SA) is often better/faster than setting up a box
-            system = forcefield.createSystem(pdb.topology, nonbondedMethod=app.NoCutoff, constraints=app.HBonds)
+            system = self._get_system(pdb.topology)
             
-            integrator = mm.LangevinIntegrator(300*unit.kelvin, 1.0/unit.picosecond, 2.0*unit.femtoseconds)
-            simulation = app.Simulation(pdb.topology, system, integrator)
+            simulation = self._create_simulation(pdb.topology, system)
             simulation.context.setPositions(pdb.positions)
             
             print("Minimizing energy...")
-            simulation.minimizeEnergy()
+            simulation.minimizeEnergy(tolerance=self.tolerance*unit.kilojoule_per_mole/unit.nanometer,
+                                      maxIterations=self.max_iterations)
             
             positions = simulation.context.getState(getPositions=True).getPositions()
             
@@ -0,0 +1,34 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+# os.umask can only be read by setting it, which isn't thread-safe, so read it once at import
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """
+    Opens a temp file next to path for writing and swaps it in over path once
+    the block finishes, so readers never see a partially written file.
+    If the block or the swap fails, the temp file is removed and the error re-raised.
+
+    The file gets the same permissions open(path, mode) would create
+    (0o666 minus the umask) rather than mkstemp's owner-only 0o600.
+
+    Args:
+        path (str): Final destination of the file.
+        mode (str): 'w' for text or 'wb' for binary.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -1,5 +1,64 @@
 import os
+import shutil
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from src.utils.atomic_write import atomic_write
+
+# (connect, read) timeouts in seconds for downloads
+DOWNLOAD_TIMEOUT = (5, 30)
+
+# Read size when streaming response bodies to disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Max concurrent HEAD probes when looking for an available AlphaFold version
+PROBE_WORKERS = 8
+
+def create_session(user_agent=None):
+    """
+    Creates a requests Session with a pooled HTTPS adapter that retries
+    rate-limited and transient server errors with exponential backoff.
+    After the retries run out, the last response is returned so callers can
+    inspect its status code as before.
+    """
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("https://", adapter)
+    if user_agent:
+        session.headers.update({'User-Agent': user_agent})
+    return session
+
+def stream_to_file(response, path):
+    """
+    Streams a response opened with stream=True to path in fixed-size chunks.
+    The body goes to a temp file in the same directory that is swapped in once
+    complete, so an interrupted download never leaves a truncated file that
+    later runs would treat as cached.
+    """
+    # Let urllib3 undo any gzip/deflate transfer encoding while streaming
+    response.raw.decode_content = True
+    with atomic_write(path, 'wb') as f:
+        shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
+
+def read_etag(path):
+    """Returns the ETag stored next to a downloaded file, or None."""
+    try:
+        with open(path + '.etag') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def write_etag(path, etag):
+    """Stores the ETag of a downloaded file in a <path>.etag sidecar."""
+    if not etag:
+        return
+    try:
+        with open(path + '.etag', 'w') as f:
+            f.write(etag)
+    except OSError as e:
+        print(f"Warning: could not store ETag for {path}: {e}")
 
 class AlphaFoldFetcher:
     """
@@ -7,11 +66,16 @@ class AlphaFoldFetcher:
     """
     BASE_URL = "https://alphafold.ebi.ac.uk/files"
 
+    # Shared across instances and fetch() calls so back-to-back downloads
+    # reuse the same keep-alive HTTPS connection.
+    # Add User-Agent to avoid being blocked
+    session = create_session('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+
     def __init__(self, download_dir="data"):
         self.download_dir = download_dir
         os.makedirs(download_dir, exist_ok=True)
 
-    def fetch(self, uniprot_id):
+    def fetch(self, uniprot_id, revalidate=False):
         """
         Downloads the PDB and JSON for a given Uniprot ID.
         Tries versions v6 down to v1.
@@ -19,6 +83,8 @@ class AlphaFoldFetcher:
         
         Args:
             uniprot_id (str): The Uniprot accession ID (e.g., Q92947).
+            revalidate (bool): Check cached files against the server with their stored
+                ETag (If-None-Match) and re-download only if they changed.
             
         Returns:
             tuple: (pdb_path, json_path)
@@ -32,6 +98,7 @@ class AlphaFoldFetcher:
         if "-" not in uniprot_id:
             ids_to_try.append(f"{uniprot_id}-1")
             
+        candidates = []
         for uid in ids_to_try:
             for version in versions:
                 # Filename format: AF-<ID>-F1-model_<version>.pdb
@@ -43,49 +110,100 @@ class AlphaFoldFetcher:
                 
                 pdb_path = os.path.join(self.download_dir, pdb_filename)
                 json_path = os.path.join(self.download_dir, json_filename)
-                
-                try:
-                    print(f"Trying {uid} {version}...")
-                    self._download(pdb_url, pdb_path)
-                    self._download(json_url, json_path)
-                    print(f"Successfully fetched {uid} {version}")
-                    return pdb_path, json_path
-                except ValueError:
-                    continue
+                candidates.append((uid, version, pdb_url, json_url, pdb_path, json_path))
+        
+        def is_cached(candidate):
+            return os.path.exists(candidate[4]) and os.path.exists(candidate[5])
+        
+        # Usually only one version exists, so probe all of them at once instead of
+        # paying one round-trip per miss. Skip the network if the preferred one is cached.
+        if is_cached(candidates[0]):
+            statuses = [None] * len(candidates)
+        else:
+            with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as executor:
+                statuses = list(executor.map(self._probe, [c[2] for c in candidates]))
+        
+        for candidate, status in zip(candidates, statuses):
+            uid, version, pdb_url, json_url, pdb_path, json_path = candidate
+            # A failed probe (None) is inconclusive, so still attempt the download
+            if not is_cached(candidate) and status not in (200, None):
+                continue
+            try:
+                print(f"Trying {uid} {version}...")
+                # The model and confidence files are independent, so download them together
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    list(executor.map(self._download, [pdb_url, json_url], [pdb_path, json_path], [revalidate] * 2))
+                print(f"Successfully fetched {uid} {version}")
+                return pdb_path, json_path
+            except ValueError:
+                continue
                 
         raise ValueError(f"Could not download data for {uniprot_id} (tried v6-v1 and isoforms)")
 
-    def _download(self, url, path):
-        if os.path.exists(path):
+    def _probe(self, url):
+        """Returns the HTTP status of a HEAD request, or None if the request failed."""
+        try:
+            return self.session.head(url, allow_redirects=True, timeout=10).status_code
+        except requests.RequestException:
+            return None
+
+    def _download(self, url, path, revalidate=False):
+        etag = read_etag(path) if os.path.exists(path) else None
+        if os.path.exists(path) and not (revalidate and etag):
             print(f"File already exists: {path}")
             return
 
+        if etag:
+            print(f"Revalidating {path}...")
+            try:
+                response = self.session.get(url, headers={'If-None-Match': etag}, timeout=DOWNLOAD_TIMEOUT, stream=True)
+            except requests.RequestException as e:
+                print(f"Could not revalidate {path} ({e}), using cached copy.")
+                return
+            with response:
+                if response.status_code == 304:
+                    print(f"Not modified: {path}")
+                    return
+                if response.status_code != 200:
+                    print(f"Could not revalidate {path} (status {response.status_code}), using cached copy.")
+                    return
+                stream_to_file(response, path)
+                write_etag(path, response.headers.get('ETag'))
+            print(f"Updated {path}")
+            return
+
         print(f"Downloading {url}...")
-        # Add User-Agent to avoid being blocked
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            with open(path, 'wb') as f:
-                f.write(response.content)
-            print(f"Saved to {path}")
-        else:
-            raise ValueError(f"Failed to download {url}. Status code: {response.status_code}")
+        with self.session.get(url, timeout=DOWNLOAD_TIMEOUT, stream=True) as response:
+            if response.status_code != 200:
+                raise ValueError(f"Failed to download {url}. Status code: {response.status_code}")
+            stream_to_file(response, path)
+            write_etag(path, response.headers.get('ETag'))
+        print(f"Saved to {path}")
 
 class RCSBFetcher:
     """
     Fetches experimental structures from RCSB PDB.
     """
+    # Shared across instances so repeated downloads reuse the connection
+    session = create_session()
+
     def __init__(self, download_dir="data"):
         self.download_dir = download_dir
         os.makedirs(download_dir, exist_ok=True)
         
+    def local_path(self, pdb_id):
+        """
+        Returns where fetch stores (or has already stored) the PDB file.
+        """
+        return os.path.join(self.download_dir, f"{pdb_id.lower()}.pdb")
+
     def fetch(self, pdb_id):
         """
         Downloads PDB file from RCSB.
         """
         pdb_id = pdb_id.lower()
         url = f"https://files.rcsb.org/download/{pdb_id}.pdb"
-        output_path = os.path.join(self.download_dir, f"{pdb_id}.pdb")
+        output_path = self.local_path(pdb_id)
         
         if os.path.exists(output_path):
             print(f"File {output_path} already exists. Skipping download.")
@@ -93,15 +211,14 @@ class RCSBFetcher:
             
         print(f"Downloading PDB {pdb_id} from {url}...")
         try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                with open(output_path, "wb") as f:
-                    f.write(response.content)
-                print(f"Downloaded {output_path}")
-                return output_path
-            else:
-                print(f"Failed to download {pdb_id}: HTTP {response.status_code}")
-                return None
+            with self.session.get(url, timeout=DOWNLOAD_TIMEOUT, stream=True) as response:
+                if response.status_code == 200:
+                    stream_to_file(response, output_path)
+                    print(f"Downloaded {output_path}")
+                    return output_path
+                else:
+                    print(f"Failed to download {pdb_id}: HTTP {response.status_code}")
+                    return None
         except Exception as e:
             print(f"Error downloading {pdb_id}: {e}")
             return None
@@ -0,0 +1,15 @@
+import json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def loads(data):
+    """
+    Parses JSON from str or bytes, using orjson when it is installed.
+    Both parsers raise a ValueError subclass on malformed input.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
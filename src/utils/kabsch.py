@@ -0,0 +1,46 @@
+import numpy as np
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # Without numba the kernel runs as plain NumPy
+        def decorator(func):
+            return func
+        return decorator
+
+@njit(cache=True, fastmath=True)
+def kabsch(P, Q):
+    """
+    Finds the rotation R and translation t that best map P onto Q (least squares).
+
+    Args:
+        P (np.array): (N, 3) float64 coordinates to move.
+        Q (np.array): (N, 3) float64 target coordinates, in the same atom order.
+
+    Returns:
+        tuple: (R, t) with R a (3, 3) proper rotation, so that P @ R.T + t ~ Q.
+    """
+    p_center = P.sum(axis=0) / P.shape[0]
+    q_center = Q.sum(axis=0) / Q.shape[0]
+    H = np.ascontiguousarray((P - p_center).T) @ (Q - q_center)
+    U, S, Vt = np.linalg.svd(H)
+    # Flip the last axis if needed so R is a rotation, not a reflection
+    D = np.eye(3)
+    if np.linalg.det(Vt.T @ U.T) < 0:
+        D[2, 2] = -1.0
+    R = np.ascontiguousarray(Vt.T) @ D @ np.ascontiguousarray(U.T)
+    t = q_center - R @ p_center
+    return R, t
+
+def superimpose(ref_coords, mob_coords):
+    """
+    Optimally rotates and translates mob_coords onto ref_coords.
+    Returns the transformed copy of mob_coords (float64).
+    """
+    ref = np.ascontiguousarray(ref_coords, dtype=np.float64)
+    mob = np.ascontiguousarray(mob_coords, dtype=np.float64)
+    R, t = kabsch(mob, ref)
+    return mob @ R.T + t
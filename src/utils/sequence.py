@@ -0,0 +1,16 @@
+# Three-letter to one-letter amino acid codes. Same table Bio.SeqUtils.seq1 uses,
+# keyed by the upper-case residue names found in PDB files.
+AA3TO1 = {
+    'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'CYS': 'C',
+    'GLN': 'Q', 'GLU': 'E', 'GLY': 'G', 'HIS': 'H', 'ILE': 'I',
+    'LEU': 'L', 'LYS': 'K', 'MET': 'M', 'PHE': 'F', 'PRO': 'P',
+    'SER': 'S', 'THR': 'T', 'TRP': 'W', 'TYR': 'Y', 'VAL': 'V',
+    'SEC': 'U', 'PYL': 'O', 'ASX': 'B', 'GLX': 'Z', 'XLE': 'J', 'XAA': 'X',
+}
+
+def residues_to_sequence(residues):
+    """
+    Builds the one-letter sequence for a list of BioPython residues.
+    Unknown residue names (ligands, modified residues) map to 'X', as with seq1.
+    """
+    return "".join(AA3TO1.get(r.resname, 'X') for r in residues)
@@ -1,27 +1,74 @@
+import functools
 import numpy as np
 import matplotlib.pyplot as plt
-from Bio.PDB import PDBParser, Superimposer
-from Bio.SeqUtils import seq1
+from src.utils.sequence import AA3TO1
+from src.utils.kabsch import superimpose
 from Bio import Align
 import argparse
 
-def get_ca_atoms_and_seq(structure):
-    atoms = []
+# Built once; scoring is identity-based since we only map residues between
+# two versions of the same protein
+_ALIGNER = Align.PairwiseAligner()
+_ALIGNER.mode = 'global'
+_ALIGNER.match_score = 2
+_ALIGNER.mismatch_score = -1
+_ALIGNER.open_gap_score = -0.5
+_ALIGNER.extend_gap_score = -0.1
+
+@functools.lru_cache(maxsize=128)
+def aligned_residue_indices(seq_a, seq_b):
+    """
+    Globally aligns two sequences and returns the indices of aligned residues.
+
+    Returns:
+        tuple: (indices into seq_a, indices into seq_b) as int64 arrays of equal length.
+            Cached per sequence pair, so the arrays are read-only.
+    """
+    if not seq_a or not seq_b:
+        raise ValueError("Cannot align an empty sequence")
+    alignment = _ALIGNER.align(seq_a, seq_b)[0]
+    a_segments, b_segments = alignment.aligned
+    if len(a_segments) == 0:
+        raise ValueError("The sequences have no aligned residues")
+    a_idx = np.concatenate([np.arange(s, e) for s, e in a_segments]).astype(np.int64)
+    b_idx = np.concatenate([np.arange(s, e) for s, e in b_segments]).astype(np.int64)
+    a_idx.setflags(write=False)
+    b_idx.setflags(write=False)
+    return a_idx, b_idx
+
+def fast_ca_parse(path, chain=None):
+    """
+    Reads only the CA atoms of the first model straight from the PDB text,
+    without building a Bio.PDB structure. HETATM residues with a CA (e.g. MSE)
+    are kept, as Bio.PDB does; unknown residue names map to 'X'.
+
+    Returns:
+        tuple: (sequence, (N, 3) float32 coordinates, residue numbers)
+    """
     seq = []
+    coords = []
     ids = []
-    for r in structure.get_residues():
-        if 'CA' in r:
-            atoms.append(r['CA'])
-            seq.append(seq1(r.get_resname()))
-            ids.append(r.id[1])
-    return "".join(seq), atoms, ids
+    seen = set()
+    with open(path) as f:
+        for line in f:
+            if line.startswith('ENDMDL'):
+                break
+            if not line.startswith(('ATOM', 'HETATM')) or line[12:16].strip() != 'CA':
+                continue
+            if chain is not None and line[21] != chain:
+                continue
+            # Keep the first alternate location of each residue
+            key = (line[21], line[22:27])
+            if key in seen:
+                continue
+            seen.add(key)
+            seq.append(AA3TO1.get(line[17:20].strip(), 'X'))
+            ids.append(int(line[22:26]))
+            coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+    return "".join(seq), np.array(coords, dtype=np.float32).reshape(-1, 3), ids
 
-def calculate_per_residue_rmsd(ref_atoms, mob_atoms):
-    diffs = []
-    for r, m in zip(ref_atoms, mob_atoms):
-        diff = r - m
-        diffs.append(np.linalg.norm(diff))
-    return np.array(diffs)
+def calculate_per_residue_rmsd(ref_coords, mob_coords):
+    return np.linalg.norm(np.asarray(ref_coords) - np.asarray(mob_coords), axis=1)
 
 def main():
     parser = argparse.ArgumentParser(description="Visualize per-residue RMSD improvement")
@@ -33,72 +80,34 @@ def main():
     
     args = parser.parse_args()
     
-    pdb_parser = PDBParser(QUIET=True)
+    # Load CA sequences and coordinates
+    gt_seq, gt_coords, gt_ids = fast_ca_parse(args.ground_truth, chain=args.gt_chain)
+    orig_seq, orig_coords, orig_ids = fast_ca_parse(args.original)
+    refined_seq, refined_coords, refined_ids = fast_ca_parse(args.refined)
     
-    # Load structures
-    gt_struct = pdb_parser.get_structure("gt", args.ground_truth)
-    if args.gt_chain:
-        gt_model = gt_struct[0][args.gt_chain]
-    else:
-        gt_model = gt_struct[0]
-        
-    orig_model = pdb_parser.get_structure("orig", args.original)[0]
-    refined_model = pdb_parser.get_structure("refined", args.refined)[0]
-    
-    # Get sequences and atoms
-    gt_seq, gt_atoms, gt_ids = get_ca_atoms_and_seq(gt_model)
-    orig_seq, orig_atoms, orig_ids = get_ca_atoms_and_seq(orig_model)
-    refined_seq, refined_atoms, refined_ids = get_ca_atoms_and_seq(refined_model)
+    if not gt_seq:
+        chain_note = f" in chain {args.gt_chain}" if args.gt_chain else ""
+        parser.error(f"No CA atoms found{chain_note} of {args.ground_truth}")
+    if not orig_seq:
+        parser.error(f"No CA atoms found in {args.original}")
+    if len(refined_seq) != len(orig_seq):
+        parser.error(f"{args.refined} has {len(refined_seq)} CA atoms but {args.original} has {len(orig_seq)}")
     
     # Align GT to Original (to map residues)
-    aligner = Align.PairwiseAligner()
-    aligner.mode = 'global'
-    aligner.match_score = 2
-    aligner.mismatch_score = -1
-    aligner.open_gap_score = -0.5
-    aligner.extend_gap_score = -0.1
-    
-    alignment = aligner.align(gt_seq, orig_seq)[0]
-    
-    # Collect aligned atoms
-    aligned_gt_atoms = []
-    aligned_orig_atoms = []
-    aligned_refined_atoms = []
-    aligned_indices = []
-    
-    gt_aligned_segments, orig_aligned_segments = alignment.aligned
-    
-    for (g_start, g_end), (o_start, o_end) in zip(gt_aligned_segments, orig_aligned_segments):
-        length = g_end - g_start
-        for i in range(length):
-            aligned_gt_atoms.append(gt_atoms[g_start + i])
-            aligned_orig_atoms.append(orig_atoms[o_start + i])
-            aligned_refined_atoms.append(refined_atoms[o_start + i]) # Assuming refined matches original exactly
-            aligned_indices.append(orig_ids[o_start + i])
+    try:
+        gt_idx, orig_idx = aligned_residue_indices(gt_seq, orig_seq)
+    except ValueError as e:
+        parser.error(f"Could not map {args.ground_truth} onto {args.original}: {e}")
+    aligned_indices = [orig_ids[i] for i in orig_idx]
 
-    # Superimpose Original to GT
-    sup_orig = Superimposer()
-    sup_orig.set_atoms(aligned_gt_atoms, aligned_orig_atoms)
-    sup_orig.apply(list(orig_model.get_atoms())) # Apply to full model
-    
-    # Superimpose Refined to GT
-    sup_ref = Superimposer()
-    sup_ref.set_atoms(aligned_gt_atoms, aligned_refined_atoms)
-    sup_ref.apply(list(refined_model.get_atoms()))
-    
-    # Calculate per-residue distances (RMSD contribution)
-    # Re-fetch coords after superimposition
-    # Note: Superimposer modifies atoms in place
-    
-    dists_orig = []
-    dists_refined = []
-    
-    for gt, orig, ref in zip(aligned_gt_atoms, aligned_orig_atoms, aligned_refined_atoms):
-        dists_orig.append(np.linalg.norm(gt.get_coord() - orig.get_coord()))
-        dists_refined.append(np.linalg.norm(gt.get_coord() - ref.get_coord()))
-        
-    dists_orig = np.array(dists_orig)
-    dists_refined = np.array(dists_refined)
+    aligned_gt = gt_coords[gt_idx]
+    # Assuming refined matches original exactly
+    aligned_orig = superimpose(aligned_gt, orig_coords[orig_idx])
+    aligned_refined = superimpose(aligned_gt, refined_coords[orig_idx])
+    
+    # Calculate per-residue distances (RMSD contribution) after superposition
+    dists_orig = calculate_per_residue_rmsd(aligned_gt, aligned_orig)
+    dists_refined = calculate_per_residue_rmsd(aligned_gt, aligned_refined)
     
     improvement = dists_orig - dists_refined
     